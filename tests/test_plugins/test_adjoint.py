@@ -755,6 +755,141 @@ def test_jax_data_array():
     da1d = JaxDataArray(values=[0.0, 1.0, 2.0, 3.0], coords=dict(x=[0, 1, 2, 3]))
     assert np.isclose(da1d.interp(x=0.5), 0.5)
 
+    # numpy coordinates are stored as lists
+    da_np = JaxDataArray(values=values, coords={key: np.array(val) for key, val in coords.items()})
+    assert da_np.coords == coords
+    assert all(isinstance(val, list) for val in da_np.coords.values())
+
+
+def test_medium_interp_linear():
+    """Test that the interpolation of the fields for the medium gradients matches xarray."""
+
+    coords = dict(x=np.linspace(-1, 1, 5), y=[0.0, 0.3, 1.2], z=[0.0], f=[FREQ0])
+    values = (1 + 1j) * np.random.random((5, 3, 1, 1))
+    data_array = td.ScalarFieldDataArray(values, coords=coords)
+
+    interp_coords = dict(x=np.linspace(-0.9, 0.9, 7), y=np.linspace(0.1, 1.1, 4))
+    values_interp = JaxMedium._interp_linear(
+        values=values, coords=coords, interp_coords=interp_coords
+    )
+    values_expected = data_array.interp(**interp_coords).values
+    assert np.allclose(values_interp, values_expected)
+
+    # points outside of the data take the value at the nearest edge
+    values_edge = JaxMedium._interp_linear(
+        values=values, coords=coords, interp_coords=dict(x=[-2, 2])
+    )
+    assert np.allclose(values_edge, values[[0, -1]])
+
+
+def make_grad_data_2d() -> Tuple[td.FieldData, td.FieldData]:
+    """Forward and adjoint gradient data of a volume without thickness along y, where the field
+    data has samples on both sides of the volume and E_fwd * E_adj = 2 + 2j at its position."""
+
+    monitor = td.FieldMonitor(
+        size=(2, 0, 2), freqs=[FREQ0], fields=["Ex", "Ey", "Ez"], name="grad_2d"
+    )
+    coords = dict(
+        x=np.linspace(-1.2, 1.2, 7), y=[-0.8, 0.0, 0.8], z=np.linspace(-1.2, 1.2, 7), f=[FREQ0]
+    )
+
+    def make_field_data(value_y0: complex) -> td.FieldData:
+        values = np.ones((7, 3, 7, 1), dtype=complex)
+        values[:, 1] = value_y0
+        field = td.ScalarFieldDataArray(values, coords=coords)
+        return td.FieldData(monitor=monitor, Ex=field, Ey=field, Ez=field)
+
+    return make_field_data(2.0), make_field_data(1.0 + 1.0j)
+
+
+def test_medium_vjp_2d():
+    """Test that the medium gradients of a 2D volume use the fields at the volume position."""
+
+    grad_data_fwd, grad_data_adj = make_grad_data_2d()
+    sim_bounds = ((-1, 0, -1), (1, 0, 1))
+
+    def inside_fn(x, y, z):
+        return np.ones_like(x, dtype=bool)
+
+    medium = JaxMedium(permittivity=2.0)
+    vjp = medium.store_vjp(grad_data_fwd, grad_data_adj, sim_bounds, 1.0, inside_fn)
+
+    # three components of (2 + 2j) integrated over an area of 4
+    vjp_eps, vjp_sigma = medium.eps_complex_to_eps_sigma(3 * 4 * (2 + 2j), FREQ0)
+    assert np.isclose(vjp.permittivity, vjp_eps)
+    assert np.isclose(vjp.conductivity, vjp_sigma)
+
+    # the fwd and adj field products are only defined on the same coordinates
+    field_shifted = grad_data_adj.Ex.assign_coords(y=[-0.8, 0.1, 0.8])
+    grad_data_shifted = grad_data_adj.updated_copy(Ex=field_shifted)
+    with pytest.raises(AdjointError):
+        medium.store_vjp(grad_data_fwd, grad_data_shifted, sim_bounds, 1.0, inside_fn)
+
+
+def test_custom_medium_vjp_2d():
+    """Test that the custom medium gradients of a 2D volume use the fields at its position."""
+
+    grad_data_fwd, grad_data_adj = make_grad_data_2d()
+    sim_bounds = ((-1, 0, -1), (1, 0, 1))
+
+    def inside_fn(x, y, z):
+        return np.ones_like(x, dtype=bool)
+
+    coords = dict(x=np.linspace(-0.8, 0.8, 5), y=[0.0], z=np.linspace(-0.8, 0.8, 5), f=[FREQ0])
+    eps_ii = JaxDataArray(values=2 + np.random.random((5, 1, 5, 1)), coords=coords)
+    eps_dataset = JaxPermittivityDataset(eps_xx=eps_ii, eps_yy=eps_ii, eps_zz=eps_ii)
+    medium_custom = JaxCustomMedium(eps_dataset=eps_dataset)
+    vjp_custom = medium_custom.store_vjp(grad_data_fwd, grad_data_adj, sim_bounds, 1.0, inside_fn)
+
+    # real part of (2 + 2j) times the area of each pixel
+    grid = medium_custom.grids(bounds=sim_bounds)["eps_xx"]
+    pixel_areas = np.outer(grid.sizes.x, grid.sizes.z).reshape((5, 1, 5, 1))
+    vjp_eps_xx = vjp_custom.eps_dataset.eps_xx.values
+    assert np.allclose(vjp_eps_xx, 2 * pixel_areas)
+
+
+def test_medium_vjp_float32(monkeypatch):
+    """Test that single precision field products give the same gradients as double precision."""
+
+    grad_data_fwd, grad_data_adj = make_grad_data_2d()
+    sim_bounds = ((-1, 0, -1), (1, 0, 1))
+    vol_coords = dict(x=np.linspace(-0.9, 0.9, 10), y=[0.0], z=np.linspace(-0.9, 0.9, 10))
+
+    def inside_fn(x, y, z):
+        return x**2 + z**2 < 0.8
+
+    coords = dict(x=np.linspace(-0.8, 0.8, 5), y=[0.0], z=np.linspace(-0.8, 0.8, 5), f=[FREQ0])
+    eps_ii = JaxDataArray(values=2 + np.random.random((5, 1, 5, 1)), coords=coords)
+    eps_dataset = JaxPermittivityDataset(eps_xx=eps_ii, eps_yy=eps_ii, eps_zz=eps_ii)
+    medium = JaxMedium(permittivity=2.0)
+    medium_custom = JaxCustomMedium(eps_dataset=eps_dataset)
+
+    def compute_vjps():
+        vjp = medium.store_vjp(grad_data_fwd, grad_data_adj, sim_bounds, 1.0, inside_fn)
+        vjp_custom = medium_custom.store_vjp(
+            grad_data_fwd, grad_data_adj, sim_bounds, 1.0, inside_fn
+        )
+        return vjp.permittivity, vjp.conductivity, vjp_custom.eps_dataset.eps_xx.values
+
+    vjps_64 = compute_vjps()
+    monkeypatch.setattr(JaxMedium, "_adjoint_dtype", np.float32)
+    monkeypatch.setattr(JaxCustomMedium, "_adjoint_dtype", np.float32)
+
+    for real, dtype in ((False, np.complex64), (True, np.float32)):
+        _, fields_eval = medium._e_dotted_volume(
+            fields=("Ex", "Ey"),
+            grad_data_fwd=grad_data_fwd,
+            grad_data_adj=grad_data_adj,
+            vol_coords=vol_coords,
+            inside_fn=inside_fn,
+            real=real,
+        )
+        assert fields_eval.dtype == dtype
+
+    vjps_32 = compute_vjps()
+    for vjp_64, vjp_32 in zip(vjps_64, vjps_32):
+        assert np.allclose(vjp_32, vjp_64, rtol=1e-5)
+
 
 def test_jax_sim_data(use_emulated_run):
     """Test mechanics of the JaxSimulationData."""
@@ -457,13 +457,13 @@ class GridSpec(Tidy3dBaseModel):
     def auto_grid_used(self) -> bool:
         """True if any of the three dimensions uses :class:`.AutoGrid`."""
         grid_list = [self.grid_x, self.grid_y, self.grid_z]
-        return np.any([isinstance(mesh, AutoGrid) for mesh in grid_list])
+        return any(isinstance(mesh, AutoGrid) for mesh in grid_list)
 
     @property
     def custom_grid_used(self) -> bool:
         """True if any of the three dimensions uses :class:`.CustomGrid`."""
         grid_list = [self.grid_x, self.grid_y, self.grid_z]
-        return np.any([isinstance(mesh, CustomGrid) for mesh in grid_list])
+        return any(isinstance(mesh, CustomGrid) for mesh in grid_list)
 
     @staticmethod
     def wavelength_from_sources(sources: List[SourceType]) -> pd.PositiveFloat:
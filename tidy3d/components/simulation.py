@@ -2810,7 +2810,7 @@ class Simulation(Box):  # pylint:disable=too-many-public-methods
 
         for medium in self.mediums:
             if isinstance(medium, AnisotropicMedium):
-                if np.any([med.allow_gain for med in [medium.xx, medium.yy, medium.zz]]):
+                if any(med.allow_gain for med in [medium.xx, medium.yy, medium.zz]):
                     return True
             elif medium.allow_gain:
                 return True
@@ -41,10 +41,22 @@ class JaxDataArray(Tidy3dBaseModel):
         description="Dictionary storing the coordinates, namely ``(direction, f, mode_index)``.",
     )
 
-    @pd.validator("coords", always=True)
+    @pd.validator("coords", pre=True, always=True)
     def _convert_coords_to_list(cls, val):
         """Convert supplied coordinates to Dict[str, list]."""
-        return {coord_name: list(coord_list) for coord_name, coord_list in val.items()}
+
+        if not isinstance(val, dict):
+            return val
+
+        def to_list(coord_list) -> list:
+            """Convert a single coordinate list, avoiding copies of lists and numpy scalars."""
+            if isinstance(coord_list, list):
+                return coord_list
+            if isinstance(coord_list, np.ndarray):
+                return coord_list.tolist()
+            return list(coord_list)
+
+        return {coord_name: to_list(coord_list) for coord_name, coord_list in val.items()}
 
     @pd.validator("values", always=True)
     def _convert_values_to_np(cls, val):
@@ -9,13 +9,14 @@ import numpy as np
 from jax.tree_util import register_pytree_node_class
 import xarray as xr
 
+from ....components.base import cached_property
 from ....components.types import Bound, Literal
 from ....components.medium import Medium, AnisotropicMedium, CustomMedium
 from ....components.geometry import Geometry
 from ....components.data.monitor_data import FieldData
 from ....components.data.dataset import PermittivityDataset
 from ....components.data.data_array import ScalarFieldDataArray
-from ....exceptions import SetupError
+from ....exceptions import SetupError, AdjointError
 from ....constants import CONDUCTIVITY
 
 from .base import JaxObject
@@ -34,6 +35,10 @@ MAX_NUM_CELLS_CUSTOM_MEDIUM = 250_000
 class AbstractJaxMedium(ABC, JaxObject):
     """Holds some utility functions for Jax medium types."""
 
+    # real floating point precision of the field products used in the gradient computation,
+    # set to np.float32 to halve the memory traffic if single precision gradients are enough
+    _adjoint_dtype = np.float64
+
     # pylint: disable =too-many-locals
     def _get_volume_disc(
         self, grad_data: FieldData, sim_bounds: Bound, wvl_mat: float
@@ -42,28 +47,26 @@ class AbstractJaxMedium(ABC, JaxObject):
 
         # find intersecting volume between structure and simulation
         mnt_bounds = grad_data.monitor.geometry.bounds
-        rmin, rmax = Geometry.bounds_intersection(mnt_bounds, sim_bounds)
-
-        # assemble volume coordinates and differential volume element
-        d_vol = 1.0
-        vol_coords = {}
-        for coord_name, min_edge, max_edge in zip("xyz", rmin, rmax):
-
-            size = max_edge - min_edge
-
-            # don't discretize this dimension if there is no thickness along it
-            if size == 0:
-                vol_coords[coord_name] = [max_edge]
-                continue
-
-            # update the volume element value
-            num_cells_dim = int(size * PTS_PER_WVL_INTEGRATION / wvl_mat) + 1
-            d_len = size / num_cells_dim
-            d_vol *= d_len
-
-            # construct the interpolation coordinates along this dimension
-            coords_interp = np.linspace(min_edge + d_len / 2, max_edge - d_len / 2, num_cells_dim)
-            vol_coords[coord_name] = coords_interp
+        rmin, rmax = np.array(Geometry.bounds_intersection(mnt_bounds, sim_bounds))
+        sizes = rmax - rmin
+
+        # don't discretize the dimensions with no thickness along them
+        has_size = sizes != 0
+
+        # differential lengths and volume element value
+        num_cells = (sizes * PTS_PER_WVL_INTEGRATION / wvl_mat).astype(int) + 1
+        d_lens = sizes / num_cells
+        d_vol = np.prod(d_lens[has_size])
+
+        # construct the interpolation coordinates along each dimension
+        vol_coords = {
+            coord_name: np.linspace(min_edge + d_len / 2, max_edge - d_len / 2, num_cells_dim)
+            if size_dim
+            else [max_edge]
+            for coord_name, min_edge, max_edge, d_len, num_cells_dim, size_dim in zip(
+                "xyz", rmin, rmax, d_lens, num_cells, has_size
+            )
+        }
 
         return vol_coords, d_vol
 
@@ -77,64 +80,143 @@ class AbstractJaxMedium(ABC, JaxObject):
         values = inside_fn(**inside_kwargs)
         return xr.DataArray(values, coords=vol_coords)
 
-    # pylint: disable=too-many-arguments
-    def e_mult_volume(
+    @staticmethod
+    def _interp_linear(
+        values: np.ndarray, coords: Dict[str, np.ndarray], interp_coords: Dict[str, np.ndarray]
+    ) -> np.ndarray:
+        """Linearly interpolate an array with coordinates ``coords``, ordered like its axes, onto
+        the grid of ``interp_coords``. Dimensions not in ``interp_coords`` are kept as is, points
+        outside of the data coordinates take the value at the nearest edge.
+
+        Note: as the interpolation points form a grid, the multi-linear interpolation is separable
+        and done one dimension at a time, without building the coordinates of every point.
+        """
+
+        for axis, (dim, coords_data) in enumerate(coords.items()):
+            if dim not in interp_coords:
+                continue
+
+            # floating point indices of the interpolation points into the data coordinates
+            coords_index = np.arange(len(coords_data))
+            index_interp = np.interp(interp_coords[dim], coords_data, coords_index)
+
+            # neighboring indices and the linear interpolation coefficient of the 'plus' one
+            index_minus = index_interp.astype(int)
+            index_plus = np.minimum(index_minus + 1, len(coords_data) - 1)
+            coeff_shape = [1] * values.ndim
+            coeff_shape[axis] = len(index_interp)
+            coeff_plus = (index_interp - index_minus).reshape(coeff_shape)
+            coeff_plus = coeff_plus.astype(values.real.dtype, copy=False)
+
+            values_minus = np.take(values, index_minus, axis=axis)
+            values_plus = np.take(values, index_plus, axis=axis)
+            values = values_minus + coeff_plus * (values_plus - values_minus)
+
+        return values
+
+    def _to_adjoint_dtype(self, values: np.ndarray) -> np.ndarray:
+        """Cast ``values`` to the precision of ``_adjoint_dtype`` if it is lower than their own."""
+
+        dtype = np.dtype(self._adjoint_dtype)
+        if np.iscomplexobj(values):
+            dtype = np.result_type(dtype, np.complex64)
+
+        if dtype.itemsize < values.dtype.itemsize:
+            return values.astype(dtype)
+        return values
+
+    # pylint: disable=too-many-arguments, too-many-locals
+    def _e_dotted_volume(
         self,
-        field: Literal["Ex", "Ey", "Ez"],
+        fields: Tuple[Literal["Ex", "Ey", "Ez"], ...],
         grad_data_fwd: FieldData,
         grad_data_adj: FieldData,
         vol_coords: Dict[str, np.ndarray],
-        d_vol: float,
         inside_fn: Callable,
-    ) -> xr.DataArray:
-        """Get the E_fwd * E_adj * dV field distribution inside of the discretized volume."""
-
-        e_fwd = grad_data_fwd.field_components[field]
-        e_adj = grad_data_adj.field_components[field]
-
-        e_dotted = e_fwd * e_adj
+        real: bool = False,
+    ) -> Tuple[xr.DataArray, xr.DataArray]:
+        """Get the inside mask and the E_fwd * E_adj field distributions of several field
+        components in the discretized volume, the latter stacked along a ``"field"`` dimension.
+        If ``real``, only the real part of E_fwd * E_adj is computed."""
 
         inside_mask = self.make_inside_mask(vol_coords=vol_coords, inside_fn=inside_fn)
 
-        isel_kwargs = {
-            key: [0]
-            for key, value in vol_coords.items()
-            if isinstance(value, float) or len(value) <= 1
-        }
-        interp_kwargs = {key: value for key, value in vol_coords.items() if key not in isel_kwargs}
+        # evaluate the fields at the volume coordinates along all dimensions, including the ones
+        # without thickness, where the data may have samples other than at the volume position
+        interp_kwargs = {key: np.atleast_1d(value) for key, value in vol_coords.items()}
+
+        # the field components live on different yee grid locations, so interpolate each of them
+        fields_values = []
+        for field in fields:
+            e_fwd = grad_data_fwd.field_components[field]
+            e_adj = grad_data_adj.field_components[field]
+
+            # the raw arrays are multiplied directly, so the fwd and adj data must be aligned
+            coords = {dim: e_fwd.coords[dim].values for dim in e_fwd.dims}
+            if e_adj.dims != e_fwd.dims or not all(
+                np.array_equal(e_adj.coords[dim].values, coords_dim)
+                for dim, coords_dim in coords.items()
+            ):
+                raise AdjointError(
+                    f"Forward and adjoint '{field}' data of the gradient monitor "
+                    f"'{grad_data_fwd.monitor.name}' have different coordinates."
+                )
 
-        fields_eval = e_dotted.isel(**isel_kwargs).interp(**interp_kwargs, assume_sorted=True)
-        inside_mask = inside_mask.isel(**isel_kwargs)
+            e_fwd_values = np.ascontiguousarray(e_fwd.values)
+            e_adj_values = np.ascontiguousarray(e_adj.values)
+            if real:
+                e_dotted_values = e_fwd_values.real * e_adj_values.real
+                e_dotted_values -= e_fwd_values.imag * e_adj_values.imag
+            else:
+                e_dotted_values = e_fwd_values * e_adj_values
+
+            e_dotted_values = self._to_adjoint_dtype(e_dotted_values)
+            fields_values.append(
+                self._interp_linear(
+                    values=e_dotted_values, coords=coords, interp_coords=interp_kwargs
+                )
+            )
 
-        return inside_mask * d_vol * fields_eval
+        # all of the interpolated components share the volume coordinates
+        fields_coords = {"field": list(fields)}
+        fields_coords.update(coords)
+        fields_coords.update(interp_kwargs)
+        fields_eval = xr.DataArray(
+            np.stack(fields_values), coords=fields_coords, dims=("field",) + tuple(coords)
+        )
 
-    def d_eps_map(
+        return inside_mask, fields_eval
+
+    # pylint: disable=too-many-arguments
+    def e_mult_volume_integrals(
         self,
+        fields: Tuple[Literal["Ex", "Ey", "Ez"], ...],
         grad_data_fwd: FieldData,
         grad_data_adj: FieldData,
-        sim_bounds: Bound,
-        wvl_mat: float,
+        vol_coords: Dict[str, np.ndarray],
+        d_vol: float,
         inside_fn: Callable,
     ) -> xr.DataArray:
-        """Mapping of gradient w.r.t. permittivity at each point in discretized volume."""
+        """Integrate E_fwd * E_adj of several field components over the inside of the discretized
+        volume with a uniform volume element, as a function of ``"field"`` and ``"f"``."""
 
-        vol_coords, d_vol = self._get_volume_disc(
-            grad_data=grad_data_fwd, sim_bounds=sim_bounds, wvl_mat=wvl_mat
+        inside_mask, fields_eval = self._e_dotted_volume(
+            fields=fields,
+            grad_data_fwd=grad_data_fwd,
+            grad_data_adj=grad_data_adj,
+            vol_coords=vol_coords,
+            inside_fn=inside_fn,
         )
 
-        e_mult_sum = 0.0
-
-        for field in ("Ex", "Ey", "Ez"):
-            e_mult_sum += self.e_mult_volume(
-                field=field,
-                grad_data_fwd=grad_data_fwd,
-                grad_data_adj=grad_data_adj,
-                vol_coords=vol_coords,
-                d_vol=d_vol,
-                inside_fn=inside_fn,
-            )
+        # masked sum over the volume in a single pass, without intermediate arrays
+        integrals = d_vol * np.einsum(
+            "xyz,cxyzf->cf",
+            inside_mask.transpose("x", "y", "z").values,
+            fields_eval.transpose("field", "x", "y", "z", "f").values,
+        )
 
-        return e_mult_sum
+        coords = {dim: fields_eval.coords[dim].values for dim in ("field", "f")}
+        return xr.DataArray(integrals, coords=coords, dims=("field", "f"))
 
 
 @register_pytree_node_class
@@ -182,17 +264,22 @@ class JaxMedium(Medium, AbstractJaxMedium):
         """Returns the gradient of the medium parameters given forward and adjoint field data."""
 
         # integrate the dot product of each E component over the volume, update vjp for epsilon
-        d_eps_map = self.d_eps_map(
+        vol_coords, d_vol = self._get_volume_disc(
+            grad_data=grad_data_fwd, sim_bounds=sim_bounds, wvl_mat=wvl_mat
+        )
+
+        e_mult_integrals = self.e_mult_volume_integrals(
+            fields=("Ex", "Ey", "Ez"),
             grad_data_fwd=grad_data_fwd,
             grad_data_adj=grad_data_adj,
-            sim_bounds=sim_bounds,
-            wvl_mat=wvl_mat,
+            vol_coords=vol_coords,
+            d_vol=d_vol,
             inside_fn=inside_fn,
         )
 
-        vjp_eps_complex = np.sum(d_eps_map.values)
+        vjp_eps_complex = np.sum(e_mult_integrals.values)
 
-        freq = d_eps_map.coords["f"][0]
+        freq = e_mult_integrals.coords["f"][0]
         vjp_eps, vjp_sigma = self.eps_complex_to_eps_sigma(vjp_eps_complex, freq)
 
         return self.copy(
@@ -231,18 +318,24 @@ class JaxAnisotropicMedium(AnisotropicMedium, AbstractJaxMedium):
     def to_medium(self) -> AnisotropicMedium:
         """Convert :class:`.JaxMedium` instance to :class:`.Medium`"""
         self_dict = self.dict(exclude={"type", "xx", "yy", "zz"})
-        for component in "xyz":
-            field_name = component + component
-            jax_medium = self.components[field_name]
-            self_dict[field_name] = jax_medium.to_medium()
+        self_dict.update(
+            {
+                field_name: jax_medium.to_medium()
+                for field_name, jax_medium in self.components.items()
+            }
+        )
         return AnisotropicMedium.parse_obj(self_dict)
 
     @classmethod
     def from_tidy3d(cls, tidy3d_obj: AnisotropicMedium) -> JaxAnisotropicMedium:
         """Convert :class:`.Tidy3dBaseModel` instance to :class:`.JaxObject`."""
         obj_dict = tidy3d_obj.dict(exclude={"type", "xx", "yy", "zz"})
-        for component, tidy3d_medium in tidy3d_obj.components.items():
-            obj_dict[component] = JaxMedium.from_tidy3d(tidy3d_medium)
+        obj_dict.update(
+            {
+                component: JaxMedium.from_tidy3d(tidy3d_medium)
+                for component, tidy3d_medium in tidy3d_obj.components.items()
+            }
+        )
         return cls.parse_obj(obj_dict)
 
     # pylint:disable=too-many-locals, too-many-arguments
@@ -261,21 +354,23 @@ class JaxAnisotropicMedium(AnisotropicMedium, AbstractJaxMedium):
             grad_data=grad_data_fwd, sim_bounds=sim_bounds, wvl_mat=wvl_mat
         )
 
+        e_mult_integrals = self.e_mult_volume_integrals(
+            fields=("Ex", "Ey", "Ez"),
+            grad_data_fwd=grad_data_fwd,
+            grad_data_adj=grad_data_adj,
+            vol_coords=vol_coords,
+            d_vol=d_vol,
+            inside_fn=inside_fn,
+        )
+        freq = e_mult_integrals.coords["f"][0]
+
         vjp_fields = {}
         for component in "xyz":
             field_name = "E" + component
             component_name = component + component
-            e_mult_dim = self.e_mult_volume(
-                field=field_name,
-                grad_data_fwd=grad_data_fwd,
-                grad_data_adj=grad_data_adj,
-                vol_coords=vol_coords,
-                d_vol=d_vol,
-                inside_fn=inside_fn,
-            )
+            e_mult_dim = e_mult_integrals.sel(field=field_name)
 
             vjp_eps_complex_ii = np.sum(e_mult_dim.values)
-            freq = e_mult_dim.coords["f"][0]
             vjp_eps_ii, vjp_sigma_ii = self.eps_complex_to_eps_sigma(vjp_eps_complex_ii, freq)
 
             vjp_fields[component_name] = JaxMedium(
@@ -395,14 +490,19 @@ class JaxCustomMedium(CustomMedium, AbstractJaxMedium):
 
     def to_medium(self) -> CustomMedium:
         """Convert :class:`.JaxMedium` instance to :class:`.Medium`"""
-        self_dict = self.dict(exclude={"type"})
+        return self._custom_medium
+
+    @cached_property
+    def _custom_medium(self) -> CustomMedium:
+        """The :class:`.CustomMedium` corresponding to this instance, built only once."""
+        # don't serialize the eps_dataset, read the data arrays from it directly instead
+        self_dict = self.dict(exclude={"type", "eps_dataset"})
         eps_field_components = {}
         for dim in "xyz":
             field_name = f"eps_{dim}{dim}"
-            data_array = self_dict["eps_dataset"][field_name]
-            values = np.array(data_array["values"])
-            coords = data_array["coords"]
-            scalar_field = ScalarFieldDataArray(values, coords=coords)
+            data_array = self.eps_dataset.field_components[field_name]
+            values = np.asarray(data_array.values)
+            scalar_field = ScalarFieldDataArray(values, coords=data_array.coords)
             eps_field_components[field_name] = scalar_field
         eps_dataset = PermittivityDataset(**eps_field_components)
         self_dict["eps_dataset"] = eps_dataset
@@ -419,8 +519,8 @@ class JaxCustomMedium(CustomMedium, AbstractJaxMedium):
         for dim in "xyz":
             field_name = f"eps_{dim}{dim}"
             data_array = eps_dataset.field_components[field_name]
-            values = data_array.values.tolist()
-            coords = {key: np.array(val).tolist() for key, val in data_array.coords.items()}
+            values = np.asarray(data_array.values)
+            coords = {key: data_array.coords[key].values for key in data_array.coords}
             field_components[field_name] = JaxDataArray(values=values, coords=coords)
         eps_dataset = JaxPermittivityDataset(**field_components)
         obj_dict["eps_dataset"] = eps_dataset
@@ -510,24 +610,32 @@ class JaxCustomMedium(CustomMedium, AbstractJaxMedium):
             # outer product all dimensions to get a volume element mask
             d_vols = np.einsum("i, j, k -> ijk", *d_sizes)
 
-            # grab the correpsonding dotted fields at these interp_coords and sum over len-1 pixels
+            # make sure this has the same dtype as the original
+            dtype_orig = np.array(orig_data_array.values).dtype
+
+            # grab the correpsonding dotted fields at these interp_coords
             field_name = "E" + dim
-            e_dotted = self.e_mult_volume(
-                field=field_name,
+            inside_mask, e_dotted = self._e_dotted_volume(
+                fields=(field_name,),
                 grad_data_fwd=grad_data_fwd,
                 grad_data_adj=grad_data_adj,
                 vol_coords=interp_coords,
-                d_vol=d_vols,
                 inside_fn=inside_fn,
-            ).sum(sum_axes)
+                real=dtype_orig.kind == "f",
+            )
+
+            # weight by the volume elements and sum over len-1 pixels, directly on the arrays
+            e_dotted = e_dotted.transpose("field", "x", "y", "z", "f").values[0]
+            inside_d_vols = inside_mask.transpose("x", "y", "z").values * d_vols
+            inside_d_vols = inside_d_vols.astype(e_dotted.real.dtype, copy=False)
+            e_mult = inside_d_vols[..., None] * e_dotted
+            sum_axis_indices = tuple("xyz".index(dim_pt) for dim_pt in sum_axes)
+            e_mult = np.sum(e_mult, axis=sum_axis_indices, keepdims=True)
 
             # reshape values to the expected vjp shape to be more safe
             vjp_shape = tuple(len(coord) for _, coord in coords.items())
 
-            # make sure this has the same dtype as the original
-            dtype_orig = np.array(orig_data_array.values).dtype
-
-            vjp_values = e_dotted.values.reshape(vjp_shape)
+            vjp_values = e_mult.reshape(vjp_shape)
             if dtype_orig.kind == "f":
                 vjp_values = vjp_values.real
             vjp_values = vjp_values.astype(dtype_orig)
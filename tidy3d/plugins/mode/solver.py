@@ -331,7 +331,7 @@ class EigSolver(Tidy3dBaseModel):
             complex_solver = (
                 cls.isinstance_complex(eps)
                 or cls.isinstance_complex(mu)
-                or np.any([cls.isinstance_complex(f) for f in der_mats])
+                or any(cls.isinstance_complex(f) for f in der_mats)
             )
             # 2) determine precision
             if complex_solver: